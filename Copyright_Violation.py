@@ -5,12 +5,20 @@ Tube-MP3 Downloader + Demucs Stem Splitter (4- or 6-stem, resume‐safe, GPU aut
 """
 
 import argparse
+import json
 import logging
+import multiprocessing
+import os
+import queue
+import shlex
 import sys
 import subprocess
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
 
 try:
     import torch
@@ -18,6 +26,12 @@ try:
 except ImportError:
     HAS_CUDA = False
 
+try:
+    from demucs.api import Separator, save_audio
+    HAS_DEMUCS_API = True
+except ImportError:
+    HAS_DEMUCS_API = False
+
 from yt_dlp import YoutubeDL, DownloadError
 
 # ── STEM DEFINITIONS ────────────────────────────────────────────────────────────
@@ -36,6 +50,32 @@ STEMS_4 = [
     "other.mp3",
 ]
 
+# Audio files picked up for splitting with --copy-codec, which keeps the source's own format
+# (everything yt-dlp's "best" audio extraction can produce); in order of preference
+AUDIO_EXTENSIONS = (
+    ".mp3", ".m4a", ".aac", ".opus", ".ogg", ".flac", ".wav", ".mka", ".wma", ".aiff", ".alac"
+)
+
+# Longest segment (seconds) accepted by the transformer models; the CLI only takes whole seconds.
+# Shorter segments save no memory: HTDemucs pads every chunk back to its training length.
+HTDEMUCS_MAX_SEGMENT = 7
+
+# Number of URLs downloaded in parallel
+MAX_DOWNLOAD_WORKERS = 8
+
+# Loaded Demucs models, keyed by (model_name, device)
+_SEPARATORS: Dict[Tuple[str, str], "Separator"] = {}
+
+# Persistent demucs_server.py processes (--isolate), keyed by (model_name, device)
+_DEMUCS_SERVERS: Dict[Tuple[str, str], subprocess.Popen] = {}
+
+# One single-process pool per GPU when sharding across several GPUs, keyed by device.
+# Each pool keeps the same worker process, so its loaded model survives between batches.
+_DEVICE_POOLS: Dict[str, ProcessPoolExecutor] = {}
+
+# Next GPU to hand a file to, so single-file batches are spread round-robin too
+_NEXT_GPU = 0
+
 
 def setup_logging() -> None:
     """Configure logging format and level"""
@@ -55,12 +95,31 @@ def find_executable(name: str) -> Optional[Path]:
     return None
 
 
+def stems_present(target_dir: Union[str, Path], stems: FrozenSet[str]) -> bool:
+    """Check that every expected stem exists in target_dir with a single directory scan"""
+    try:
+        with os.scandir(target_dir) as it:
+            names = {entry.name for entry in it}
+    except FileNotFoundError:
+        return False
+    return stems.issubset(names)
+
+
 def run_subprocess(cmd: List[str]) -> None:
     """Run a subprocess command and handle errors"""
     logging.debug("Running command: %s", " ".join(cmd))
     subprocess.run(cmd, check=True)
 
 
+def is_interactive() -> bool:
+    """Whether we run in a terminal with a desktop session (so opening a file explorer makes sense)"""
+    if not sys.stdout.isatty():
+        return False
+    if sys.platform.startswith("win") or sys.platform == "darwin":
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
 def open_folder(path: Path) -> None:
     """Open a folder in the system file explorer"""
     if sys.platform.startswith("win"):
@@ -71,29 +130,218 @@ def open_folder(path: Path) -> None:
         subprocess.Popen(["xdg-open", str(path)])
 
 
+def get_separator(model_name: str, device: str) -> "Separator":
+    """Return a cached in-process Demucs separator, loading the model on first use"""
+    key = (model_name, device)
+    if key not in _SEPARATORS:
+        logging.info("Loading Demucs model %s on %s", model_name, device)
+        _SEPARATORS[key] = Separator(model=model_name, device=device, segment=HTDEMUCS_MAX_SEGMENT)
+    return _SEPARATORS[key]
+
+
+def decode_audio(path: Path, samplerate: int, channels: int) -> "torch.Tensor":
+    """Decode an audio file to a (channels, samples) float32 tensor with a single ffmpeg pipe"""
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-i", str(path),
+        "-vn",
+        "-f", "f32le",
+        "-ar", str(samplerate),
+        "-ac", str(channels),
+        "-"
+    ]
+    raw = subprocess.run(cmd, check=True, capture_output=True).stdout
+    if not raw:
+        raise ValueError(f"ffmpeg decoded no audio from {path}")
+    # clone() gives the tensor its own writable storage instead of the read-only bytes
+    return torch.frombuffer(raw, dtype=torch.float32).clone().view(-1, channels).t()
+
+
+def separate_in_process(
+    mp3_files: List[Path],
+    out_dir: Path,
+    device: str,
+    model_name: str
+) -> bool:
+    """
+    Separate stems with the Demucs Python API, reusing the loaded model across tracks.
+    Returns False if the model could not be loaded (nothing was processed).
+    """
+    try:
+        separator = get_separator(model_name, device)
+    except Exception:
+        logging.exception("Could not load Demucs model %s on %s", model_name, device)
+        return False
+    # Mixed precision on GPU; dropped for the rest of the batch if a track fails under it
+    half = device.startswith("cuda")
+    decode_args = (separator.samplerate, separator.audio_channels)
+    with ThreadPoolExecutor(max_workers=1) as decoder:
+        next_wav = decoder.submit(decode_audio, mp3_files[0], *decode_args) if mp3_files else None
+        for i, mp3 in enumerate(mp3_files):
+            logging.info(" - %s", mp3.name)
+            wav = next_wav
+            # Decode the next track on the CPU while this one is on the GPU
+            if i + 1 < len(mp3_files):
+                next_wav = decoder.submit(decode_audio, mp3_files[i + 1], *decode_args)
+            try:
+                stems = None
+                if half:
+                    try:
+                        with torch.autocast("cuda", dtype=torch.float16):
+                            _, stems = separator.separate_tensor(wav.result(), separator.samplerate)
+                    except RuntimeError as e:
+                        logging.warning("FP16 separation failed for %s (%s); retrying in FP32", mp3.name, e)
+                        half = False
+                if stems is None:
+                    _, stems = separator.separate_tensor(wav.result(), separator.samplerate)
+                target_dir = out_dir / model_name / mp3.stem
+                target_dir.mkdir(parents=True, exist_ok=True)
+                for name, source in stems.items():
+                    save_audio(source.float(), target_dir / f"{name}.mp3", samplerate=separator.samplerate)
+            except (subprocess.CalledProcessError, RuntimeError, OSError, ValueError) as e:
+                logging.error("Demucs failed for %s: %s", mp3, e)
+    return True
+
+
+def get_demucs_server(model_name: str, device: str) -> subprocess.Popen:
+    """Return a running demucs_server.py process, starting it on first use"""
+    key = (model_name, device)
+    server = _DEMUCS_SERVERS.get(key)
+    if server is None or server.poll() is not None:
+        cmd = [
+            sys.executable, str(Path(__file__).with_name("demucs_server.py")),
+            "-n", model_name,
+            "--device", device
+        ]
+        logging.debug("Starting Demucs server: %s", " ".join(cmd))
+        server = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        _DEMUCS_SERVERS[key] = server
+    return server
+
+
+def separate_in_server(
+    mp3_files: List[Path],
+    out_dir: Path,
+    device: str,
+    model_name: str
+) -> List[Path]:
+    """
+    Separate stems in a persistent Demucs server process, one JSON job per line.
+    Returns the files left unprocessed if the server exits early.
+    """
+    server = get_demucs_server(model_name, device)
+    for i, mp3 in enumerate(mp3_files):
+        logging.info(" - %s", mp3.name)
+        try:
+            server.stdin.write(json.dumps({"mp3": str(mp3), "out_dir": str(out_dir)}) + "\n")
+            server.stdin.flush()
+        except BrokenPipeError:
+            return mp3_files[i:]
+        if server.stdout.readline().strip() != "done":
+            return mp3_files[i:]
+    return []
+
+
+def split_on_device(
+    mp3_files: List[Path],
+    out_dir: Path,
+    demucs_cmd: List[str],
+    device: str,
+    model_name: str,
+    stems: FrozenSet[str],
+    isolate: bool
+) -> None:
+    """Worker-process entry point: separate one shard of files on a single device"""
+    setup_logging()
+    run_demucs(mp3_files, out_dir, demucs_cmd, device, model_name, stems, isolate)
+
+
+def get_device_pool(device: str) -> ProcessPoolExecutor:
+    """Return the long-lived worker process pool for a GPU, starting it on first use"""
+    if device not in _DEVICE_POOLS:
+        context = multiprocessing.get_context("spawn")
+        _DEVICE_POOLS[device] = ProcessPoolExecutor(max_workers=1, mp_context=context)
+    return _DEVICE_POOLS[device]
+
+
 def run_demucs(
     mp3_files: List[Path],
     out_dir: Path,
     demucs_cmd: List[str],
     device: str,
-    model_name: str
+    model_name: str,
+    stems: FrozenSet[str],
+    isolate: bool = False
 ) -> None:
-    """Separate stems using Demucs CLI or fallback module"""
+    """
+    Separate stems in-process via the Demucs API (or in a persistent server process if isolate),
+    falling back to the CLI (one batched call). stems is the expected stem file set per track.
+    """
+    global _NEXT_GPU
+    # Several GPUs: always go through the persistent worker process (with its own model) of each GPU,
+    # even for one file, so no model is also loaded in this process
+    n_gpus = torch.cuda.device_count() if device == "cuda" else 1
+    if n_gpus > 1:
+        shards: Dict[str, List[Path]] = {}
+        for mp3 in mp3_files:
+            shards.setdefault(f"cuda:{_NEXT_GPU}", []).append(mp3)
+            _NEXT_GPU = (_NEXT_GPU + 1) % n_gpus
+        logging.info("Demucs: Sharding %d file(s) across %d GPU(s)", len(mp3_files), len(shards))
+        futures = {
+            gpu: get_device_pool(gpu).submit(
+                split_on_device, shard, out_dir, demucs_cmd, gpu, model_name, stems, isolate
+            )
+            for gpu, shard in shards.items()
+        }
+        for gpu, future in futures.items():
+            try:
+                future.result()
+            except BrokenProcessPool:
+                # Drop the dead pool so the next batch starts a fresh worker
+                logging.error("Demucs worker for %s crashed; %d file(s) not split", gpu, len(shards[gpu]))
+                _DEVICE_POOLS.pop(gpu, None)
+        return
+
     logging.info("Demucs: Processing %d file(s) with model %s on %s", len(mp3_files), model_name, device)
+    if isolate:
+        mp3_files = separate_in_server(mp3_files, out_dir, device, model_name)
+        if not mp3_files:
+            return
+        logging.warning("Demucs server exited; falling back to the CLI for %d file(s)", len(mp3_files))
+    elif HAS_DEMUCS_API:
+        if separate_in_process(mp3_files, out_dir, device, model_name):
+            return
+        logging.warning("Falling back to the Demucs CLI for %d file(s)", len(mp3_files))
+
     for mp3 in mp3_files:
         logging.info(" - %s", mp3.name)
-        cmd = [
-            *demucs_cmd,
-            str(mp3),
-            "--device", device,
-            "--segment", "7",
-            "-n", model_name,
-            "--mp3",
-            "--filename", "{track}/{stem}.{ext}",
-            "--out", str(out_dir)
-        ]
+    options = [
+        "--device", device,
+        "--segment", str(HTDEMUCS_MAX_SEGMENT),
+        "-n", model_name,
+        "--mp3",
+        "--filename", "{track}/{stem}.{ext}",
+        "--out", str(out_dir)
+    ]
+    # Load the model once for the whole batch
+    try:
+        run_subprocess([*demucs_cmd, *map(str, mp3_files), *options])
+        return
+    except subprocess.CalledProcessError as e:
+        if len(mp3_files) == 1:
+            logging.error("Demucs failed for %s: %s", mp3_files[0], e)
+            return
+        logging.warning("Demucs batch failed (%s); retrying file by file", e)
+
+    # The CLI stops at the first failing track; don't redo the ones it finished before that
+    model_root = os.path.join(out_dir, model_name)
+    for mp3 in mp3_files:
+        if stems_present(os.path.join(model_root, mp3.stem), stems):
+            continue
         try:
-            run_subprocess(cmd)
+            run_subprocess([*demucs_cmd, str(mp3), *options])
         except subprocess.CalledProcessError as e:
             logging.error("Demucs failed for %s: %s", mp3, e)
 
@@ -102,60 +350,258 @@ def sweep_directories(
     base: Path,
     demucs_cmd: List[str],
     device: str,
-    stems: List[str],
-    model_name: str
+    stems: FrozenSet[str],
+    model_name: str,
+    isolate: bool = False,
+    extensions: Tuple[str, ...] = (".mp3",)
 ) -> None:
     """
-    Scan subdirectories for unsplit MP3s and run Demucs on missing stems.
+    Scan subdirectories for unsplit MP3s (or other given extensions) and run Demucs on missing stems.
     (Example: ./downloads/MyFolder/*.mp3 → check ./downloads/MyFolder/<model_name>/<track>/)
+    If a track exists in several formats, only the first one in extensions is split.
     """
-    for folder in base.iterdir():
-        if not folder.is_dir():
-            continue
-        mp3s = list(folder.glob("*.mp3"))
-        if not mp3s:
+    with os.scandir(base) as it:
+        # DirEntry.is_dir() uses the cached type from the scan, no extra stat
+        folders = [entry for entry in it if entry.is_dir()]
+
+    # Plain strings in the per-track loop; Paths are only built for files that need splitting
+    for folder in folders:
+        with os.scandir(folder.path) as it:
+            # Case-insensitive, like glob("*.mp3") on Windows (Song.MP3)
+            tracks = {}
+            for entry in it:
+                track, ext = os.path.splitext(entry.name)
+                ext = ext.lower()
+                if ext not in extensions or not entry.is_file():
+                    continue
+                # a.mp3 and a.wav would both split into <model_name>/a/; keep the preferred one
+                if track not in tracks or extensions.index(ext) < extensions.index(tracks[track][0]):
+                    tracks[track] = (ext, entry.path)
+        if not tracks:
             continue
 
         pending = []
-        for mp3 in mp3s:
-            target_dir = folder / model_name / mp3.stem
+        model_root = os.path.join(folder.path, model_name)
+        for track, (_, path) in tracks.items():
             # If folder doesn't exist or is missing any expected stem, add to pending
-            if not target_dir.exists() or not all((target_dir / s).exists() for s in stems):
-                pending.append(mp3)
+            if not stems_present(os.path.join(model_root, track), stems):
+                pending.append(Path(path))
 
         if pending:
             logging.info("Folder %s: %d files to split", folder.name, len(pending))
-            run_demucs(pending, folder, demucs_cmd, device, model_name)
+            run_demucs(pending, Path(folder.path), demucs_cmd, device, model_name, stems, isolate)
         else:
             logging.info("Folder %s: all stems present", folder.name)
 
 
+def split_worker(
+    split_queue: "queue.Queue[Optional[Path]]",
+    out_dir: Path,
+    demucs_cmd: List[str],
+    device: str,
+    stems: FrozenSet[str],
+    model_name: str,
+    isolate: bool = False
+) -> None:
+    """
+    Consume finished downloads and split them while later downloads are still running.
+    Whatever is queued at the time is split as one batch; None marks the end of the downloads.
+    """
+    seen = set()
+    done = False
+    model_root = os.path.join(out_dir, model_name)
+    while not done:
+        batch = [split_queue.get()]
+        while True:
+            try:
+                batch.append(split_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        to_split = []
+        for mp3 in batch:
+            if mp3 is None:
+                done = True
+                continue
+            if mp3 in seen:
+                continue
+            seen.add(mp3)
+            # Queue it if the folder doesn't exist or is missing any expected file
+            if not stems_present(os.path.join(model_root, mp3.stem), stems):
+                to_split.append(mp3)
+            else:
+                logging.info("Skipping %s (all %d stems already present)", mp3.name, len(stems))
+
+        if to_split:
+            # A failed batch must not stop the worker; later downloads still need splitting
+            try:
+                run_demucs(to_split, out_dir, demucs_cmd, device, model_name, stems, isolate)
+            except Exception:
+                logging.exception("Demucs batch failed: %s", ", ".join(mp3.name for mp3 in to_split))
+
+
+def find_existing(base: str, extensions: Tuple[str, ...]) -> Optional[Path]:
+    """Return the already-downloaded audio file for an output path without extension, if any"""
+    for ext in extensions:
+        if os.path.exists(base + ext):
+            return Path(base + ext)
+    return None
+
+
+def download_one(
+    url: str,
+    ydl_opts: dict,
+    extensions: Tuple[str, ...],
+    on_existing: Callable[[Path], None],
+    claim: Callable[[str], bool]
+) -> None:
+    """
+    Download a single URL with its own YoutubeDL instance.
+    The URL is extracted once: its metadata gives the output filename, and if that audio is already
+    in the output folder it is passed to on_existing instead of being downloaded again.
+    claim(filename) must return True before downloading, so parallel workers never write the same file.
+    """
+    try:
+        with YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            # Playlists and redirects are left to yt-dlp
+            if info.get("_type", "video") == "video":
+                base = os.path.splitext(ydl.prepare_filename(info))[0]
+                existing = find_existing(base, extensions)
+                if existing:
+                    logging.info("Skipping download of %s (already have %s)", url, existing.name)
+                    on_existing(existing)
+                    return
+                if not claim(base):
+                    logging.info("Skipping %s (same output file as another URL in this job)", url)
+                    return
+            ydl.process_ie_result(info, download=True)
+    except DownloadError as e:
+        logging.error("Download failed for %s: %s", url, e)
+
+
 def download_audio(
     urls: List[str],
     out_dir: Path,
-    ffmpeg_path: Optional[Path]
+    ffmpeg_path: Optional[Path],
+    on_finished: Optional[Callable[[Path], None]] = None,
+    aria2c_path: Optional[Path] = None,
+    copy_codec: bool = False
 ) -> List[Path]:
-    """Download audio from YouTube URLs and return list of downloaded mp3 paths"""
+    """
+    Download audio from YouTube URLs in parallel and return list of downloaded audio paths.
+    on_finished, if given, is called with each file as soon as it is fully post-processed.
+    If aria2c_path is given, files are fetched by aria2c over multiple connections.
+    If copy_codec, the source audio stream is kept as-is instead of re-encoded to MP3.
+    """
+    downloaded: List[Path] = []
+
+    def hook(d: dict) -> None:
+        # MoveFiles is the last post-processing step; filepath is the final audio file
+        if d["status"] == "finished" and d["postprocessor"] == "MoveFiles":
+            path = Path(d["info_dict"]["filepath"])
+            if path.suffix.lower() in AUDIO_EXTENSIONS:
+                downloaded.append(path)
+                if on_finished:
+                    on_finished(path)
+
     ydl_opts = {
         "format": "bestaudio/best",
         "outtmpl": str(out_dir / "%(title)s.%(ext)s"),
         "postprocessors": [
-            {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "0"},
+            # "best" stream-copies the native codec; "mp3" re-encodes unless the source is already MP3
+            {
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": "best" if copy_codec else "mp3",
+                "preferredquality": "0",
+            },
             {"key": "EmbedThumbnail"},
             {"key": "FFmpegMetadata"},
         ],
         "ffmpeg_location": str(ffmpeg_path.parent) if ffmpeg_path else None,
+        "concurrent_fragment_downloads": 8,
+        # Larger reads/writes and chunked requests; fewer round-trips on slow or network storage
+        "buffersize": 64 * 1024,
+        "http_chunk_size": 10 * 1024 * 1024,
+        "retries": 10,
+        "fragment_retries": 10,
+        "postprocessor_hooks": [hook],
         "quiet": False,
     }
-    with YoutubeDL(ydl_opts) as ydl:
-        ydl.download(urls)
-    return list(out_dir.glob("*.mp3"))
+    if aria2c_path:
+        ydl_opts["external_downloader"] = {"default": str(aria2c_path)}
+        ydl_opts["external_downloader_args"] = {"aria2c": ["-x16", "-s16", "-k1M"]}
+
+    def report_existing(path: Path) -> None:
+        # Already downloaded: skip yt-dlp but still return it (and split it if asked)
+        downloaded.append(path)
+        if on_finished:
+            on_finished(path)
+
+    # Output files already being written by a worker (different URLs can share one: youtu.be vs
+    # watch?v=, &t= variants, equal titles)
+    claimed = set()
+    claim_lock = threading.Lock()
+
+    def claim(base: str) -> bool:
+        with claim_lock:
+            if base in claimed:
+                return False
+            claimed.add(base)
+            return True
+
+    # Drop duplicate URLs; each worker then probes and downloads its URL in one go
+    urls = list(dict.fromkeys(urls))
+    extensions = AUDIO_EXTENSIONS if copy_codec else (".mp3",)
+    if urls:
+        with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(urls))) as pool:
+            list(pool.map(lambda url: download_one(url, ydl_opts, extensions, report_existing, claim), urls))
+    # Only the requested URLs' files, not unrelated leftovers in out_dir
+    return list(dict.fromkeys(downloaded))
+
+
+def process_job(urls: List[str], args: argparse.Namespace, cached: Dict[str, Any]) -> None:
+    """Download (and optionally split) one batch of URLs using the state set up in main"""
+    demucs_cmd = cached["demucs_cmd"]
+    device = cached["device"]
+    stems = cached["stems"]
+    model_name = cached["model_name"]
+    download_dir = cached["download_dir"]
+
+    # Split each MP3 as soon as it is downloaded, overlapping downloads and Demucs
+    split_queue: "queue.Queue[Optional[Path]]" = queue.Queue()
+    splitter = None
+    if args.split:
+        splitter = threading.Thread(
+            target=split_worker,
+            args=(split_queue, download_dir, demucs_cmd, device, stems, model_name, args.isolate),
+        )
+        splitter.start()
+
+    # Download any new MP3s
+    try:
+        mp3_list = download_audio(
+            urls, download_dir, cached["ffmpeg_path"],
+            on_finished=split_queue.put if splitter else None,
+            aria2c_path=cached["aria2c_path"],
+            copy_codec=args.copy_codec,
+        )
+    finally:
+        if splitter:
+            split_queue.put(None)
+            splitter.join()
+
+    # Open the folder after processing
+    if mp3_list and args.open:
+        open_folder(mp3_list[0].parent)
+
+    logging.info("Processing complete.")
 
 
 def main() -> None:
     setup_logging()
     parser = argparse.ArgumentParser(description="Tube-MP3 Downloader + Demucs Stem Splitter")
-    parser.add_argument("urls", nargs="+", help="YouTube video URLs to download and process")
+    parser.add_argument("urls", nargs="*", help="YouTube video URLs to download and process")
     parser.add_argument("--sweep", action="store_true", help="Sweep existing directories for MP3s missing stems")
     parser.add_argument("--split", action="store_true", help="Split newly downloaded MP3s into stems")
     parser.add_argument("--cpu", action="store_true", help="Force Demucs to run on CPU")
@@ -167,7 +613,34 @@ def main() -> None:
         default=6,
         help="Number of stems to split: 4 or 6 (default: 6)"
     )
+    parser.add_argument(
+        "--copy-codec",
+        action="store_true",
+        help="Keep the source audio codec (e.g. opus, m4a) instead of re-encoding to MP3"
+    )
+    parser.add_argument(
+        "--isolate",
+        action="store_true",
+        help="Run Demucs in a persistent helper process instead of in this one"
+    )
+    parser.add_argument(
+        "--open",
+        dest="open",
+        action="store_true",
+        default=None,
+        help="Open the downloads folder when done (default: only in an interactive desktop session)"
+    )
+    parser.add_argument("--no-open", dest="open", action="store_false", help="Never open the downloads folder")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and read more URLs from stdin, one job per line"
+    )
     args = parser.parse_args()
+    if not (args.urls or args.sweep or args.daemon):
+        parser.error("give at least one URL, or use --sweep or --daemon")
+    if args.open is None:
+        args.open = is_interactive()
 
     base = Path.cwd()
     ffmpeg_path = find_executable("ffmpeg")
@@ -175,6 +648,12 @@ def main() -> None:
         logging.error("ffmpeg is required. Please install ffmpeg.")
         sys.exit(1)
 
+    # Optional: multi-connection downloads; yt-dlp's own downloader is used otherwise
+    aria2c = shutil.which("aria2c")
+    aria2c_path = Path(aria2c) if aria2c else None
+    if not aria2c_path:
+        logging.debug("aria2c not found in PATH; using yt-dlp's built-in downloader")
+
     demucs_path = find_executable("demucs")
     if demucs_path:
         demucs_cmd = [str(demucs_path)]
@@ -191,42 +670,51 @@ def main() -> None:
 
     # ── NEW: choose between 4‐stem or 6‐stem model ───────────────────────────────
     if args.stems == 6:
-        stems = STEMS_6
+        stems = frozenset(STEMS_6)
         model_name = "htdemucs_6s"
     else:
-        stems = STEMS_4
+        stems = frozenset(STEMS_4)
         model_name = "htdemucs"
 
     # If --sweep was passed, scan subfolders and split only missing stems
     if args.sweep:
-        sweep_directories(base, demucs_cmd, device, stems, model_name)
+        sweep_directories(
+            base, demucs_cmd, device, stems, model_name, args.isolate,
+            extensions=AUDIO_EXTENSIONS if args.copy_codec else (".mp3",),
+        )
 
     # Ensure downloads folder exists
     download_dir = base / "downloads"
     download_dir.mkdir(exist_ok=True)
 
-    # Download any new MP3s
-    mp3_list = download_audio(args.urls, download_dir, ffmpeg_path)
-
-    # ── NEW “only‐split‐if‐missing” logic ─────────────────────────────────────────
-    if args.split and mp3_list:
-        to_split = []
-        for mp3 in mp3_list:
-            target_dir = download_dir / model_name / mp3.stem
-            # Queue it if the folder doesn't exist or is missing any expected file
-            if not target_dir.exists() or not all((target_dir / s).exists() for s in stems):
-                to_split.append(mp3)
-            else:
-                logging.info("Skipping %s (all %d stems already present)", mp3.name, len(stems))
-
-        if to_split:
-            run_demucs(to_split, download_dir, demucs_cmd, device, model_name)
-
-    # Open the folder after processing
-    if mp3_list:
-        open_folder(mp3_list[0].parent)
-
-    logging.info("Processing complete.")
+    # Everything looked up above is reused by every job (the Demucs model is cached separately)
+    cached = {
+        "ffmpeg_path": ffmpeg_path,
+        "aria2c_path": aria2c_path,
+        "demucs_cmd": demucs_cmd,
+        "device": device,
+        "stems": stems,
+        "model_name": model_name,
+        "download_dir": download_dir,
+    }
+    if args.urls:
+        process_job(args.urls, args, cached)
+
+    if args.daemon:
+        logging.info("Daemon mode: reading URLs from stdin (Ctrl+D to exit)")
+        while line := sys.stdin.readline():
+            try:
+                urls = shlex.split(line)
+            except ValueError as e:
+                logging.error("Ignoring malformed line %r: %s", line.strip(), e)
+                continue
+            if not urls:
+                continue
+            # One failed job must not take down the daemon
+            try:
+                process_job(urls, args, cached)
+            except Exception:
+                logging.exception("Job failed: %s", " ".join(urls))
 
 
 if __name__ == "__main__":
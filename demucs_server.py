@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Persistent Demucs worker for Copyright_Violation.py --isolate
+Loads the model once, then reads one JSON job per line from stdin ({"mp3": ..., "out_dir": ...})
+and answers "done" on stdout when the job's stems are written.
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+from Copyright_Violation import HAS_DEMUCS_API, separate_in_process, setup_logging
+
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Persistent Demucs stem-splitting server")
+    parser.add_argument("-n", dest="model_name", required=True, help="Demucs model name")
+    parser.add_argument("--device", required=True, help="Torch device to run on")
+    args = parser.parse_args()
+
+    if not HAS_DEMUCS_API:
+        logging.error("demucs.api is required (Demucs 4.1+).")
+        sys.exit(1)
+
+    # Logging goes to stderr, so stdout only carries the acknowledgements
+    while line := sys.stdin.readline():
+        # One bad job must not cost the resident model: log it and still acknowledge
+        try:
+            job = json.loads(line)
+            loaded = separate_in_process([Path(job["mp3"])], Path(job["out_dir"]), args.device, args.model_name)
+        except Exception:
+            logging.exception("Job failed: %s", line.strip())
+            loaded = True
+        if not loaded:
+            # Model could not be loaded: exit so the client falls back to the CLI
+            sys.exit(1)
+        print("done", flush=True)
+
+
+if __name__ == "__main__":
+    main()